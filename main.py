@@ -1,17 +1,29 @@
 import os
+import sys
 import json
+import shutil
 import time
 import random
+import math
 import re
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timezone
 from itertools import product
+from collections import ChainMap
+from functools import lru_cache
 from urllib.parse import urlparse
+from email.utils import formatdate
 
-import xml.etree.ElementTree
+from lxml import etree as LET
 import dotenv
 import argparse
 import concurrent.futures
+import threading
+import logging
+import queue
+import atexit
+from logging.handlers import QueueHandler, QueueListener
 
 try:
 
@@ -20,29 +32,118 @@ try:
 except ImportError:
     pass
 
+log = logging.getLogger("ph-archive")  # stable name whether run as a script or imported
+
 CONFIG_FILE = 'config.json'
+MANIFEST_FILE = 'captured.json'  # filepath -> size of every capture already on disk
+HTTP_CACHE_FILE = 'http_cache.json'  # url -> latest capture path, its ETag/Last-Modified and fetch time
 CAPTURES_DIR = 'rss'
 DELAY_RANGE = (1, 3)  # seconds, shorter to keep jobs fast
 MAX_RETRIES = 3
 BACKOFF_FACTOR = 2
+BACKOFF_JITTER = 0.5  # up to +50% random spread so retrying threads fall out of lockstep
+MAX_BACKOFF = 30  # seconds
 REQUEST_TIMEOUT = 10  # seconds
+MAX_WORKERS = 16
+HTTP_POOL_SIZE = max(32, MAX_WORKERS)  # below MAX_WORKERS urllib3 discards connections ("pool is full")
+MAX_HOST_CONCURRENCY = 2  # simultaneous requests allowed per host
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+_CAPTURES_REAL = os.path.realpath(CAPTURES_DIR)  # resolved once; checked for every target
+_SUBST_RE = re.compile(r'\$?\{([^}]+)\}')
+_MISSING = object()  # placeholder value for variables a template names but the config lacks
+USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_6_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.6 Mobile/15E148 Safari/604.1 OPT/5.0.5"
+
+# Shared parser: drops whitespace-only text so a single round-trip minifies the feed
+_PARSER = LET.XMLParser(remove_blank_text=True, huge_tree=False, recover=False)
+
+# One pooled session for every request so keep-alive connections are reused across threads
+_SESSION = requests.Session()
+# Retries are handled (with backoff) by fetch_url, not by urllib3
+_ADAPTER = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+_SESSION.mount('https://', _ADAPTER)
+_SESSION.mount('http://', _ADAPTER)
+_SESSION.headers.update({"User-Agent": USER_AGENT})
+
+@lru_cache(maxsize=None)
+def _realdir(folder):
+    return os.path.realpath(folder)
 
 def is_safe_path(base_dir, path):
-    base_dir = os.path.realpath(base_dir)
-    path = os.path.realpath(path)
-    return os.path.commonpath([base_dir]) == os.path.commonpath([base_dir, path])
+    base_dir = _CAPTURES_REAL if base_dir == CAPTURES_DIR else os.path.realpath(base_dir)
+    if os.path.islink(path):
+        path = os.path.realpath(path)
+    else:
+        # Targets share a handful of parent directories; resolve each of those only once
+        folder, name = os.path.split(path)
+        path = os.path.normpath(os.path.join(_realdir(folder), name))
+    return path == base_dir or path.startswith(base_dir + os.sep)
+
+def setup_logging():
+    """Logs to stdout, written synchronously until queue_logging() is called."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(handler)
+
+def queue_logging():
+    """Moves the root handlers behind a queue so worker threads never block on stdout."""
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
 
 def load_config():
     with open(CONFIG_FILE, 'r') as f:
         return json.load(f)
 
-def substitute(template, variables):
-    variables = dict(variables)
-    variables['today'] = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+_MANIFEST = {}
+_HTTP_CACHE = {}
+NOT_MODIFIED = object()  # fetch_url result for a 304 response
+
+def load_state(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_state(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+@lru_cache(maxsize=None)
+def template_names(template):
+    """Returns the distinct placeholder names used in template, in order."""
+    return tuple(dict.fromkeys(_SUBST_RE.findall(template)))
+
+@lru_cache(maxsize=4096)
+def _substitute_cached(template, today, values):
+    variables = {name: value for name, value in zip(template_names(template), values) if value is not _MISSING}
     def replacer(match):
         var = match.group(1)
-        return str(variables.get(var, match.group(0)))
-    return re.sub(r'\$?\{([^}]+)\}', replacer, template)
+        if var == 'today':
+            return today
+        return variables.get(var, match.group(0))
+    return _SUBST_RE.sub(replacer, template)
+
+def substitute(template, variables, today=None):
+    if '{' not in template:
+        # Nothing to substitute (e.g. a literal base or URL)
+        return template
+    if today is None:
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    # Key the cache on the rendered values of only the variables this template
+    # references, so combinations differing in unrelated variables share a result
+    values = tuple(str(variables[name]) if name in variables else _MISSING for name in template_names(template))
+    return _substitute_cached(template, today, values)
 
 def expand_targets(defs, targets):
     # Separate fixed and list variables from defs
@@ -56,58 +157,65 @@ def expand_targets(defs, targets):
     }
 
     all_expanded_targets = []
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
 
-    # Generate all combinations from defs list variables
-    defs_combinations = []
+    # Lazily generate all combinations from defs list variables
     if list_defs:
         list_product_keys = sorted(list(list_defs.keys())) # Ensure consistent order
         list_product_values = [list_defs[key] for key in list_product_keys]
-        for combo_values in product(*list_product_values):
-            combo_dict = {}
-            for i, list_key in enumerate(list_product_keys):
-                template_var_name = list_var_template_names_map.get(list_key, list_key)
-                combo_dict[template_var_name] = combo_values[i]
-            defs_combinations.append(combo_dict)
+        template_var_names = [list_var_template_names_map.get(key, key) for key in list_product_keys]
+        defs_combinations = (dict(zip(template_var_names, combo_values)) for combo_values in product(*list_product_values))
     else:
-        defs_combinations.append({}) # No list variables in defs, so just one empty combination
+        defs_combinations = [{}] # No list variables in defs, so just one empty combination
+
+    # Target variables don't depend on the defs combination, so split them up front
+    target_meta = []
+    for target in targets:
+        # Separate fixed and list variables from target vars
+        target_vars = target.get('vars', {})
+        fixed_target_vars = {k: v for k, v in target_vars.items() if not isinstance(v, list)}
+        list_target_vars = {k: v for k, v in target_vars.items() if isinstance(v, list)}
+
+        # Generate all combinations from target list variables
+        target_combinations = []
+        if list_target_vars:
+            target_list_product_keys = sorted(list(list_target_vars.keys())) # Ensure consistent order
+            target_list_product_values = [list_target_vars[key] for key in target_list_product_keys]
+            for combo_values in product(*target_list_product_values):
+                combo_dict = dict(zip(target_list_product_keys, combo_values))
+                target_combinations.append(combo_dict)
+        else:
+            target_combinations.append({}) # No list variables in target, so just one empty combination
+        target_meta.append((target, fixed_target_vars, target_combinations))
+
+    # Template variable used for language grouping (e.g., "langs" -> "lang")
+    lang_var = list_var_template_names_map.get('langs', 'langs')
+
+    # 'base' only needs per-combination substitution if it references a list variable
+    base_template = defs.get('base', '')
+    base_is_fixed = set(_SUBST_RE.findall(base_template)).isdisjoint(list_var_template_names_map.values())
+    if base_is_fixed:
+        fixed_base = substitute(base_template, fixed_defs, today)
 
     for defs_combo in defs_combinations:
         # Construct the base variables for the current defs combination
-        current_base_vars_for_base_sub = {**fixed_defs, **defs_combo}
-        current_base_vars = {**current_base_vars_for_base_sub}
+        current_base_vars = {**fixed_defs, **defs_combo}
         # Substitute 'base' now that all defs variables are available for this combination
-        current_base_vars['base'] = substitute(defs.get('base', ''), current_base_vars_for_base_sub)
-
-        for target in targets:
-            # Separate fixed and list variables from target vars
-            target_vars = target.get('vars', {})
-            fixed_target_vars = {k: v for k, v in target_vars.items() if not isinstance(v, list)}
-            list_target_vars = {k: v for k, v in target_vars.items() if isinstance(v, list)}
-
-            # Generate all combinations from target list variables
-            target_combinations = []
-            if list_target_vars:
-                target_list_product_keys = sorted(list(list_target_vars.keys())) # Ensure consistent order
-                target_list_product_values = [list_target_vars[key] for key in target_list_product_keys]
-                for combo_values in product(*target_list_product_values):
-                    combo_dict = dict(zip(target_list_product_keys, combo_values))
-                    target_combinations.append(combo_dict)
-            else:
-                target_combinations.append({}) # No list variables in target, so just one empty combination
+        if base_is_fixed:
+            current_base_vars['base'] = fixed_base
+        else:
+            current_base_vars['base'] = substitute(base_template, current_base_vars, today)
 
+        for target, fixed_target_vars, target_combinations in target_meta:
             for target_combo in target_combinations:
-                # Combine all variables for the final substitution
-                all_vars = {
-                    **current_base_vars,
-                    **fixed_target_vars,
-                    **target_combo
-                }
+                # Layer all variables for the final substitution without copying them
+                all_vars = ChainMap(target_combo, fixed_target_vars, current_base_vars)
 
-                filepath = substitute(target.get('filepath', ''), all_vars)
-                url = substitute(target.get('url', ''), all_vars)
+                filepath = substitute(target.get('filepath', ''), all_vars, today)
+                url = substitute(target.get('url', ''), all_vars, today)
 
                 # Extract language for grouping if present in all_vars
-                lang = all_vars.get(list_var_template_names_map.get('langs', 'langs'))
+                lang = all_vars.get(lang_var)
 
                 expanded_entry = {'filepath': filepath, 'url': url}
                 if lang:
@@ -117,103 +225,237 @@ def expand_targets(defs, targets):
     return all_expanded_targets
 
 ALLOWED_DOMAINS = {"https://www.producthunt.com"}
+ALLOWED_HOSTS = frozenset(urlparse(u).netloc.lower() for u in ALLOWED_DOMAINS)
+
+_HOST_SEMAPHORES = {}
+_HOST_PACING_LOCKS = {}
+_HOST_NEXT_OK = {}  # host -> time.monotonic() before which no new request may start
+_HOST_STATE_LOCK = threading.Lock()
+
+def _host_resource(registry, host, factory):
+    with _HOST_STATE_LOCK:
+        if host not in registry:
+            registry[host] = factory()
+        return registry[host]
+
+def host_semaphore(host):
+    """Returns the semaphore bounding concurrent requests to host, creating it on first use."""
+    return _host_resource(_HOST_SEMAPHORES, host, lambda: threading.BoundedSemaphore(MAX_HOST_CONCURRENCY))
+
+def wait_for_host_turn(host):
+    """Blocks until host may receive another request, then books the next slot.
+
+    Request starts against one host are spaced by a random DELAY_RANGE gap, while
+    requests to other hosts (and this thread's parsing) proceed without waiting.
+    """
+    with _host_resource(_HOST_PACING_LOCKS, host, threading.Lock):
+        wait = _HOST_NEXT_OK.get(host, 0.0) - time.monotonic()
+        if wait > 0:
+            log.info("Waiting %.2f seconds before next request to %s", wait, host)
+            time.sleep(wait)
+        _HOST_NEXT_OK[host] = time.monotonic() + random.uniform(*DELAY_RANGE)
+
+def process_one_entry(entry):
+    """Fetches and saves a single expanded target.
+
+    Returns a failure dict, or None if the target was saved or skipped.
+    """
+    if 'filepath' not in entry:
+        log.error("Main loop: Entry missing 'filepath': %s", entry)
+        return {"url": entry.get('url', '[NO URL]'), "filepath": "[MISSING FILEPATH]", "error": "missing filepath"}
+    filepath = os.path.join(CAPTURES_DIR, entry['filepath'])
+    # Hot path: the manifest only ever records paths that already passed the checks below
+    if _MANIFEST.get(filepath, 0) > 0:
+        log.info("Skipping %s -> %s (recorded in manifest)", entry.get('url', '[NO URL]'), filepath)
+        return None
+    if not is_safe_path(CAPTURES_DIR, filepath):
+        log.error("Unsafe filepath detected: %s", filepath)
+        return {"url": entry.get('url', '[NO URL]'), "filepath": filepath, "error": "unsafe filepath"}
+    url = entry.get('url', '[NO URL]')
+    if url == '[NO URL]':
+        log.error("Main loop: Entry missing 'url' for filepath: %s", filepath)
+        return {"url": "[MISSING URL]", "filepath": filepath, "error": "Missing URL in config entry"}
+    host = urlparse(url).netloc.lower()
+    if host not in ALLOWED_HOSTS:
+        log.error("URL host not in allowed domains: %s", url)
+        return {"url": url, "filepath": filepath, "error": "disallowed host"}
 
-def process_language_targets(language_targets):
-    """Processes a list of targets for a single language sequentially."""
-    language_failures = []
-    for entry in language_targets:
-        if 'filepath' not in entry:
-            print(f"[ERROR] Main loop: Entry missing 'filepath': {entry}")
-            language_failures.append({"url": entry.get('url', '[NO URL]'), "filepath": "[MISSING FILEPATH]", "error": "missing filepath"})
-            continue
-        filepath = os.path.join(CAPTURES_DIR, entry['filepath'])
-        if not is_safe_path(CAPTURES_DIR, filepath):
-            print(f"[ERROR] Unsafe filepath detected: {filepath}")
-            language_failures.append({"url": entry.get('url', '[NO URL]'), "filepath": filepath, "error": "unsafe filepath"})
-            continue
-        url = entry.get('url', '[NO URL]')
-        if url == '[NO URL]':
-            print(f"[ERROR] Main loop: Entry missing 'url' for filepath: {filepath}")
-            language_failures.append({"url": "[MISSING URL]", "filepath": filepath, "error": "Missing URL in config entry"})
-            continue
-
-        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-            print(f"[INFO] Skipping {url} -> {filepath} (file exists and is non-empty)")
-            continue
-
-        print(f"[INFO] Processing {url} -> {filepath}")
-        content = fetch_url(url)
-        if content:
-            ## check if the content is valid xml
-            try:
-                xml.etree.ElementTree.fromstring(content)
-            except xml.etree.ElementTree.ParseError:
-                print(f"[ERROR] Invalid XML content for {url}")
-                language_failures.append({"url": url, "filepath": filepath, "error": "invalid XML"})
-                continue
-            ## minify the xml
-            content = xml.etree.ElementTree.fromstring(content)
-            content = xml.etree.ElementTree.tostring(content, encoding='utf-8').decode('utf-8')
-            save_content(os.path.dirname(filepath), os.path.basename(filepath), content)
-            print(f"[INFO] Saved content for {url} to {filepath}")
-        else:
-            print(f"[ERROR] Failed to fetch content for {url}")
-            language_failures.append({"url": url, "filepath": filepath, "error": "fetch failed"})
+    try:
+        size = os.stat(filepath).st_size
+    except FileNotFoundError:
+        size = 0
+    if size > 0:
+        log.info("Skipping %s -> %s (file exists and is non-empty)", url, filepath)
+        _MANIFEST[filepath] = size
+        return None
+
+    # Conditional GETs only make sense while the capture they vouch for is still on disk
+    cache_entry = _HTTP_CACHE.get(url)
+    if cache_entry:
+        if not os.path.exists(cache_entry['filepath']):
+            cache_entry = None
+        elif not cache_entry.get('etag') and not cache_entry.get('last_modified'):
+            # No server validator; fall back to when the previous capture was fetched.
+            # File mtimes are no substitute: a fresh checkout stamps every file with "now"
+            cache_entry = {**cache_entry, 'last_modified': cache_entry.get('fetched_at')}
+
+    # Skipped, unchanged-on-disk and misconfigured entries never reach the network,
+    # so they neither book a pacing slot nor hold the host semaphore
+    with host_semaphore(host):
+        wait_for_host_turn(host)
+        log.info("Processing %s -> %s", url, filepath)
+        resp = fetch_url(url, cache_entry=cache_entry)
+        if resp is NOT_MODIFIED:
+            # Archive the unchanged feed by copying its latest capture; nothing to download or parse
+            copy_capture(cache_entry['filepath'], filepath)
+            log.info("Not modified: copied %s to %s", cache_entry['filepath'], filepath)
+            _MANIFEST[filepath] = os.path.getsize(filepath)
+            _HTTP_CACHE[url] = {**_HTTP_CACHE[url], 'filepath': filepath}
+            return None
+    if resp is None:
+        log.error("Failed to fetch content for %s", url)
+        return {"url": url, "filepath": filepath, "error": "fetch failed"}
+    ## validate and minify the xml in a single parse
+    try:
+        root = LET.fromstring(resp.content, _PARSER)
+    except LET.XMLSyntaxError:
+        log.error("Invalid XML content for %s", url)
+        return {"url": url, "filepath": filepath, "error": "invalid XML"}
+    content = LET.tostring(root, encoding='utf-8')
+    save_content(os.path.dirname(filepath), os.path.basename(filepath), content)
+    log.info("Saved content for %s to %s", url, filepath)
+    _MANIFEST[filepath] = os.path.getsize(filepath)
+    _HTTP_CACHE[url] = {
+        'etag': resp.headers.get('ETag'),
+        'last_modified': resp.headers.get('Last-Modified'),
+        'fetched_at': resp.headers.get('Date') or formatdate(time.time(), usegmt=True),
+        'filepath': filepath,
+    }
+    return None
 
-        delay = random.uniform(*DELAY_RANGE)
-        print(f"[INFO] Sleeping for {delay:.2f} seconds...")
-        time.sleep(delay)
-    return language_failures
+def backoff_delay(attempt):
+    return min(MAX_BACKOFF, BACKOFF_FACTOR ** attempt) * (1 + random.uniform(0, BACKOFF_JITTER))
 
-def fetch_url(url):
-    headers = {"User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 17_6_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.6 Mobile/15E148 Safari/604.1 OPT/5.0.5"}
+def retry_after_delay(resp, default):
+    try:
+        delay = float(resp.headers.get('Retry-After', default))
+    except ValueError:
+        # HTTP-date form; not worth parsing for a capped wait
+        return default
+    if not math.isfinite(delay):
+        return default
+    return max(0.0, min(MAX_BACKOFF, delay))
+
+def fetch_url(url, cache_entry=None):
+    headers = {}
+    if cache_entry:
+        if cache_entry.get('etag'):
+            headers['If-None-Match'] = cache_entry['etag']
+        if cache_entry.get('last_modified'):
+            headers['If-Modified-Since'] = cache_entry['last_modified']
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            resp = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            resp = _SESSION.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
             if resp.status_code == 200:
-                return resp.text
-            elif resp.status_code in (429, 500, 502, 503, 504):
-                print(f"[WARN] Retrying {url} due to status {resp.status_code} (attempt {attempt}/{MAX_RETRIES})")
-                time.sleep(BACKOFF_FACTOR ** attempt)
+                return resp
+            if resp.status_code == 304 and headers:
+                # Only meaningful as an answer to our own validators; an unsolicited
+                # 304 has no previous capture to copy and falls through as an error
+                return NOT_MODIFIED
+            if resp.status_code in (429, 500, 502, 503, 504):
+                log.warning("Retrying %s due to status %s (attempt %s/%s)", url, resp.status_code, attempt, MAX_RETRIES)
+                delay = backoff_delay(attempt)
+                if resp.status_code == 429:
+                    delay = retry_after_delay(resp, delay)
+                if attempt < MAX_RETRIES:
+                    time.sleep(delay)
             else:
-                print(f"[ERROR] Non-retryable error {resp.status_code} for {url}")
+                log.error("Non-retryable error %s for %s", resp.status_code, url)
                 return None
         except requests.exceptions.RequestException as e_req:
-            print(f"[ERROR] RequestException during fetch for {url} (attempt {attempt}/{MAX_RETRIES}): {e_req}")
-            time.sleep(BACKOFF_FACTOR ** attempt)
-    print(f"[ERROR] Failed to fetch {url} after {MAX_RETRIES} attempts.")
+            log.error("RequestException during fetch for %s (attempt %s/%s): %s", url, attempt, MAX_RETRIES, e_req)
+            if attempt < MAX_RETRIES:
+                time.sleep(backoff_delay(attempt))
+    log.error("Failed to fetch %s after %s attempts.", url, MAX_RETRIES)
     return None
 
+def copy_capture(src, dst):
+    tmp_path = temp_path_for(dst)
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def temp_path_for(filepath):
+    folder, filename = os.path.split(filepath)
+    return os.path.join(folder, f'.{filename}.tmp')
+
 def save_content(folder, filename, content):
-    os.makedirs(folder, exist_ok=True)
+    # Folders are created up front by generate_folders; write-then-rename so a
+    # crash never leaves a truncated file behind
     file_path = os.path.join(folder, filename)
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
-
-def generate_folders(defs, targets):
-    expanded = expand_targets(defs, targets)
+    tmp_path = temp_path_for(file_path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, file_path)
+    except Exception:
+        # A stray temp file would otherwise be committed along with rss/
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def generate_folders(expanded):
+    # Many targets share a parent directory; create each one only once
+    dirs = set()
     for entry in expanded:
         if 'filepath' not in entry:
-            print(f"[ERROR] Entry missing 'filepath': {entry}")
+            log.error("Entry missing 'filepath': %s", entry)
             continue
-        filepath = os.path.join(CAPTURES_DIR, entry['filepath'])
-        print(f"[INFO] Creating parent directory for: {filepath}")
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        dirs.add(os.path.dirname(os.path.join(CAPTURES_DIR, entry['filepath'])))
+    for folder in sorted(dirs):
+        log.info("Creating directory: %s", folder)
+        os.makedirs(folder, exist_ok=True)
+
+def split_message(message, limit):
+    """Splits message into chunks of at most limit characters, preferring line breaks."""
+    chunks = []
+    current = ''
+    for line in message.split('\n'):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
 
 def send_telegram_message(message):
     token = os.environ.get('TELEGRAM_BOT_TOKEN')
     chat_id = os.environ.get('TELEGRAM_CHAT_ID')
     if not token or not chat_id:
-        print("Telegram bot token or chat ID not set; skipping notification.")
+        log.warning("Telegram bot token or chat ID not set; skipping notification.")
         return
     url = f"https://api.telegram.org/bot{token}/sendMessage"
-    data = {"chat_id": chat_id, "text": message, "parse_mode": "Markdown"}
-    try:
-        resp = requests.post(url, data=data, timeout=REQUEST_TIMEOUT)
-        if resp.status_code != 200:
-            print(f"Failed to send Telegram message: {resp.text}")
-    except Exception as e:
-        print(f"Exception sending Telegram message: {e}")
+    # Chunks go out in order over the pooled keep-alive connection
+    for chunk in split_message(message, TELEGRAM_MAX_MESSAGE_LENGTH):
+        data = {"chat_id": chat_id, "text": chunk, "parse_mode": "Markdown"}
+        try:
+            resp = _SESSION.post(url, data=data, timeout=REQUEST_TIMEOUT)
+            if resp.status_code != 200:
+                log.error("Failed to send Telegram message: %s", resp.text)
+        except Exception as e:
+            log.error("Exception sending Telegram message: %s", e)
 
 def main():
     parser = argparse.ArgumentParser()
@@ -221,35 +463,37 @@ def main():
     parser.add_argument('--test', action='store_true', help='Test mode: process only a subset of items')
     parser.add_argument('--random', action='store_true', help='Shuffle items before processing (only active if --test is also specified)')
     parser.add_argument('--number', type=int, default=1, help='Number of items to process in test mode (default: 1)')
+    parser.add_argument('--refresh-manifest', action='store_true', help='Ignore the capture manifest and re-check every file on disk')
     args = parser.parse_args()
+    setup_logging()
 
     config = load_config()
     defs = config.get('defs', {})
     targets = config.get('target', [])
 
-    # Generate folders for all potential targets initially
-    generate_folders(defs, targets)
     expanded = expand_targets(defs, targets)
+    # Generate folders for all potential targets initially
+    generate_folders(expanded)
 
     if args.test:
         if args.random:
-            print("[INFO] Test mode: Randomizing target list.")
+            log.info("Test mode: Randomizing target list.")
             random.shuffle(expanded)
         else:
-            print("[INFO] Test mode: Using first N targets.")
+            log.info("Test mode: Using first N targets.")
         if args.number > len(expanded):
-            print(f"[WARN] Requested number ({args.number}) is more than available targets ({len(expanded)}). Processing all available.")
+            log.warning("Requested number (%s) is more than available targets (%s). Processing all available.", args.number, len(expanded))
             args.number = len(expanded)
         expanded = expanded[:args.number]
-        print(f"[INFO] Test mode: Processing {len(expanded)} item(s).")
+        log.info("Test mode: Processing %s item(s).", len(expanded))
 
     if args.dry_run:
-        print('[INFO] Dry run: expanded URLs and paths to be processed:')
+        print('Dry run: expanded URLs and paths to be processed:')
         if not expanded:
-            print("[INFO] No items selected for dry run.")
+            print("No items selected for dry run.")
         for entry in expanded:
             if 'filepath' not in entry:
-                print(f"[ERROR] Dry run: Entry missing 'filepath': {entry}")
+                log.error("Dry run: Entry missing 'filepath': %s", entry)
                 continue
             filepath = os.path.join(CAPTURES_DIR, entry['filepath'])
             url = entry.get('url', '[NO URL]')
@@ -259,39 +503,46 @@ def main():
 
     failures = []
     if not expanded:
-        print("[INFO] No items to process.")
-
-    # Group targets by language
-    language_groups = {}
-    for entry in expanded:
-        lang = entry.get('lang', 'default')  # Use 'default' if no language is specified
-        if lang not in language_groups:
-            language_groups[lang] = []
-        language_groups[lang].append(entry)
-
-    # Process each language group in parallel using ThreadPoolExecutor
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_to_lang = {
-            executor.submit(process_language_targets, targets_for_lang):
-            lang for lang, targets_for_lang in language_groups.items()
-        }
-        for future in concurrent.futures.as_completed(future_to_lang):
-            lang = future_to_lang[future]
+        log.info("No items to process.")
+
+    if not args.refresh_manifest:
+        _MANIFEST.update(load_state(MANIFEST_FILE))
+    _HTTP_CACHE.update(load_state(HTTP_CACHE_FILE))
+
+    if not args.test:
+        # Don't queue work the manifest already accounts for; workers still stat the rest
+        pending = [e for e in expanded if _MANIFEST.get(os.path.join(CAPTURES_DIR, e.get('filepath', '')), 0) <= 0]
+        if len(pending) < len(expanded):
+            log.info("Skipping %s target(s) recorded in manifest; %s left to process.", len(expanded) - len(pending), len(pending))
+        expanded = pending
+
+    # Process every URL in parallel; per-host semaphores keep each site's load polite.
+    # Workers beyond MAX_HOST_CONCURRENCY per host would only park on those semaphores.
+    hosts = {urlparse(entry.get('url', '')).netloc.lower() for entry in expanded}
+    workers = max(1, min(MAX_WORKERS, len(expanded), MAX_HOST_CONCURRENCY * len(hosts)))
+    queue_logging()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        future_to_entry = {executor.submit(process_one_entry, entry): entry for entry in expanded}
+        for future in concurrent.futures.as_completed(future_to_entry):
+            entry = future_to_entry[future]
             try:
-                language_failures = future.result()
-                failures.extend(language_failures)
-                print(f"[INFO] Finished processing language group: {lang}")
+                failure = future.result()
+                if failure:
+                    failures.append(failure)
             except Exception as exc:
-                print(f"[ERROR] Language group {lang} generated an exception: {exc}")
-                failures.append({"language": lang, "error": str(exc), "type": "thread_exception"})
+                log.error("Target %s generated an exception: %s", entry.get('url', '[NO URL]'), exc)
+                failures.append({"url": entry.get('url', '[NO URL]'), "filepath": entry.get('filepath', 'unknown'), "error": str(exc), "type": "thread_exception"})
+    save_state(MANIFEST_FILE, _MANIFEST)
+    save_state(HTTP_CACHE_FILE, _HTTP_CACHE)
 
     if failures:
         msg_lines = [f"*Capture Failures* ({datetime.now(timezone.utc).isoformat()} UTC):"]
         for f in failures:
-            msg_lines.append(f"- `{f.get('url', f.get('language', 'unknown'))}` for `{f.get('filepath', 'unknown')}`: {f['error']}")
+            key = f.get('url') or f.get('language') or 'unknown'
+            msg_lines.append(f"- `{key}` for `{f.get('filepath', 'unknown')}`: {f['error']}")
         send_telegram_message('\n'.join(msg_lines))
 
-    print("[INFO] Script finished.")
+    log.info("Script finished.")
 
 if __name__ == '__main__':
     main()